@@ -1,11 +1,16 @@
 import pathlib
+import hashlib
+from os import replace, scandir, unlink
+from tempfile import NamedTemporaryFile
+from zipfile import BadZipFile
 import networkx as nx
 from ast import literal_eval
-from numpy import genfromtxt, minimum
+from numpy import array, genfromtxt, load, minimum, newaxis, savez, zeros
 from scipy.spatial.distance import cdist
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.colors import LinearSegmentedColormap
-from statistics import mean
+from functools import lru_cache
 import warnings
 
 # Special characters for parsing files
@@ -15,7 +20,16 @@ BASKET_LABEL = '@'
 
 DISTANCE_SCALE_FACTOR = 32*4
 
+# Pre-parsed map data is cached in each map folder, and rebuilt whenever the source files change
+COMPILED_FILENAME = 'compiled.npz'
+COMPILED_VERSION = 2
+SOURCE_FILES = ('gushers.csv', 'distance_modifiers.txt', 'connections.txt', 'weights.txt', 'priors.txt')
+
+# Used for maps without a priors.txt file: the Goldie is equally likely to be in any gusher
+DEFAULT_PRIORS = "{'.': 1}"
+
 # Constants for plotting graphs
+FIGURE_SIZE = (6, 6)
 EXTENTS = {'ap': (660, 300, 760),
            'lo': (396, 222, 1074),
            'mb': (570, 260, 870),
@@ -44,157 +58,335 @@ LOW_CDICT =  {'red':   [[0.0, 0.0, 0.0],
 high_cmap = LinearSegmentedColormap('HighPath', segmentdata=HIGH_CDICT, N=256)
 low_cmap = LinearSegmentedColormap('LowPath', segmentdata=LOW_CDICT, N=256)
 
+MAPS_PATH = pathlib.Path(__file__).parent.resolve() / 'maps'
+IMAGES_PATH = pathlib.Path(__file__).parent.resolve() / 'images'
+
+MAP_CACHE_SIZE = 32  # number of GusherMaps kept in memory by load_map()
+
+
+def map_ids():
+    """Return the IDs of all available maps, i.e. the names of the folders in 'goldieseeker/maps'."""
+    return [f.name for f in scandir(MAPS_PATH) if f.is_dir()]
+
+
+def _file_stamp(path):
+    if not path.exists():  # optional source files
+        return [0, -1]
+    stat = path.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _file_hash(path):
+    if not path.exists():
+        return ''
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def _read_dict_line(path, default=None):
+    """Read a dictionary literal from the first non-commented line of a file."""
+    if default is not None and not path.exists():
+        return default
+    with open(str(path)) as f:
+        return next(line for line in f if not line.lstrip().startswith(COMMENT_CHAR)).strip()
+
+
+def compile_map(path):
+    """Parse the source files in a map folder into a dictionary of arrays, in the format stored in COMPILED_FILENAME.
+    The distances matrix includes the distance modifiers but not squad mode, which is applied when loading."""
+    # Read gusher names and coordinates
+    gushers = genfromtxt(str(path/'gushers.csv'), delimiter=',', names=['name', 'coord'], dtype=['U8', '2u4'])
+    names, coords = gushers['name'], gushers['coord']
+
+    # Read norm from the 2nd line of the file
+    filename = str(path/'distance_modifiers.txt')
+    with open(filename) as f:
+        f.readline()
+        norm_raw = f.readline().split(': ')[-1].strip(' \n')
+    norm = float(norm_raw)
+    distances = cdist(coords, coords, 'minkowski', p=norm) / DISTANCE_SCALE_FACTOR
+    try:
+        distances += genfromtxt(filename, delimiter=',', comments=COMMENT_CHAR)
+    except ValueError as e:
+        warnings.warn(f"Couldn't read distance modifiers from '{filename}'\n" + str(e))
+
+    # Read the map name from the first line of the file, then the adjacency list (like nx.read_adjlist)
+    filename = str(path/'connections.txt')
+    index = {name: i for i, name in enumerate(names)}
+    adjacency = zeros(distances.shape, dtype=bool)
+    connected = set()
+    with open(filename) as f:
+        map_name = f.readline().strip(COMMENT_CHAR + ' \n')
+        f.seek(0)
+        for line in f:
+            vertices = line.split(COMMENT_CHAR)[0].split()
+            if not vertices:
+                continue
+            connected.update(vertices)
+            for neighbor in vertices[1:]:
+                adjacency[index[vertices[0]], index[neighbor]] = True
+                adjacency[index[neighbor], index[vertices[0]]] = True
+    assert len(names) == len(connected) + 1, f"Couldn't read {filename}\n" + \
+                                             f"Distances matrix is {len(names)}x{len(names)} " + \
+                                             f"but connections graph has {len(connected)} vertices"
+
+    weights = _read_dict_line(path/'weights.txt')
+    priors = _read_dict_line(path/'priors.txt', default=DEFAULT_PRIORS)
+
+    sources = [path/source for source in SOURCE_FILES]
+    return {'version': COMPILED_VERSION, 'name': map_name, 'names': names, 'coords': coords,
+            'distances': distances, 'adjacency': adjacency, 'weights': weights, 'priors': priors,
+            'stamps': array([_file_stamp(source) for source in sources]),
+            'hashes': array([_file_hash(source) for source in sources])}
+
+
+def load_compiled_map(path):
+    """Return the compiled arrays for a map folder, (re)building COMPILED_FILENAME if it is missing or out of date.
+    The compiled file is considered up to date if the source files' modification times and sizes are unchanged, or
+    failing that, if their contents are unchanged. If the map folder isn't writable, the map is compiled in memory."""
+    compiled_path = path/COMPILED_FILENAME
+    sources = [path/source for source in SOURCE_FILES]
+    try:
+        with load(str(compiled_path)) as npz:
+            compiled = {key: npz[key] for key in npz.files}
+        if compiled['version'] != COMPILED_VERSION:
+            raise ValueError('outdated compiled map format')
+        if [_file_stamp(source) for source in sources] == compiled['stamps'].tolist():
+            return compiled
+        if [_file_hash(source) for source in sources] != compiled['hashes'].tolist():
+            raise ValueError('source files have changed')
+        # Source files were touched but not modified; update the stamps so we can skip hashing next time
+        compiled['stamps'] = array([_file_stamp(source) for source in sources])
+    except (OSError, ValueError, KeyError, BadZipFile):
+        compiled = compile_map(path)
+
+    temp_name = None
+    try:
+        with NamedTemporaryFile(dir=str(path), suffix='.npz', delete=False) as f:
+            temp_name = f.name
+            savez(f, **compiled)
+        replace(temp_name, str(compiled_path))
+    except OSError:
+        # Don't leave a partial or orphaned temporary file behind in the map folder
+        if temp_name:
+            try:
+                unlink(temp_name)
+            except OSError:
+                pass
+    return compiled
+
 
 # noinspection PyTypeChecker,PyTypeChecker
 class GusherMap:
-    def __init__(self, map_id, weights=None, squad=False):
+    def __init__(self, map_id, weights=None, squad=False, priors=None):
         self.map_id = map_id
-        self._path = pathlib.Path(__file__).parent.resolve() / f'maps/{map_id}'
-
-        self._load_gushers(str(self._path/'gushers.csv'))
-        self._load_distances(str(self._path/'distance_modifiers.txt'), squad)
+        self._path = MAPS_PATH / map_id
+        self._load_compiled(load_compiled_map(self._path), weights, squad, priors)
+
+    @classmethod
+    def from_compiled(cls, map_id, compiled, weights=None, squad=False, priors=None):
+        """Build a map directly from arrays in the format returned by compile_map(), e.g. for synthetic maps."""
+        gusher_map = cls.__new__(cls)
+        gusher_map.map_id = map_id
+        gusher_map._path = None
+        gusher_map._load_compiled(compiled, weights, squad, priors)
+        return gusher_map
+
+    def _load_compiled(self, compiled, weights=None, squad=False, priors=None):
+        self.squad = squad
+        self.name = str(compiled['name'])
+        self._names = [str(name) for name in compiled['names']]
+        self._coords = compiled['coords']
+        self._load_distances(compiled['distances'], squad)
         self._validate_distances()
-        self._load_connections(str(self._path/'connections.txt'))
+        self._load_connections(compiled['adjacency'])
         if not weights:
-            # Read the weight dictionary from the first non-commented line of the file
-            # https://stackoverflow.com/a/26284995
-            f = (line for line in open(str(self._path/'weights.txt'))
-                 if not line.lstrip().startswith(COMMENT_CHAR))
-            weights = next(f).strip()
+            weights = str(compiled['weights'])
         self._load_weights(literal_eval(weights))
-
-    def _load_gushers(self, filename):
-        self._gushers = genfromtxt(filename, delimiter=',', names=['name', 'coord'], dtype=['U8', '2u4'])
+        if not priors:
+            priors = str(compiled.get('priors', DEFAULT_PRIORS))
+        self._load_priors(literal_eval(priors))
+        self._distances_graph = None  # networkx graphs are only built if needed, see distances and connections
+        self._connections_graph = None
+        self._positions = None  # cached by _plot_positions()
 
     # TODO - use tkg's exact distances
-    def _load_distances(self, filename, squad=False):
-        coords = self._gushers['coord']
-        # Read norm from the 2nd line of the file
-        with open(filename) as f:
-            f.readline()
-            norm_raw = f.readline().split(': ')[-1].strip(' \n')
-        norm = float(norm_raw)
-        adjacency_matrix = cdist(coords, coords, 'minkowski', p=norm) / DISTANCE_SCALE_FACTOR
-        try:
-            distance_modifiers = genfromtxt(filename, delimiter=',', comments=COMMENT_CHAR)
-            adjacency_matrix += distance_modifiers
-            if squad:
-                # Assume that it never takes longer to reach a gusher than it would have taken coming from basket/spawn
-                adjacency_matrix = minimum(adjacency_matrix, adjacency_matrix[0, :])
-        except ValueError as e:
-            warnings.warn(f"Couldn't read distance modifiers from '{filename}'\n" + str(e))
-        self.distances = nx.from_numpy_array(adjacency_matrix, create_using=nx.DiGraph)
-        # noinspection PyTypeChecker
-        nx.relabel_nodes(self.distances, lambda i: self._gushers['name'][i], False)
-
-    # May not be necessary
-    def _load_distances_all_equal(self, nodes, all_distances=1, norm=2):
-        self.distances = nx.complete_graph(nodes, create_using=nx.DiGraph)
-        nx.set_edge_attributes(self.distances, all_distances, name='weight')
-        # Use real distances for outgoing edges from the basket
-        basket_distances = cdist(self._gushers['coord'][0].reshape(1, 2),
-                                 self._gushers['coord'][1:],
-                                 metric='minkowski', p=norm) / DISTANCE_SCALE_FACTOR
-        edge_list = [(BASKET_LABEL, self._gushers['name'][i+1], basket_distances[0][i]) for i in range(len(nodes))]
-        self.distances.add_node(BASKET_LABEL)
-        self.distances.add_weighted_edges_from(edge_list)
+    def _load_distances(self, distances, squad=False):
+        if squad:
+            # Assume that it never takes longer to reach a gusher than it would have taken coming from basket/spawn
+            distances = minimum(distances, distances[0, :])
+        self._distances = distances
+        self._distance_rows = distances.tolist()  # indexing nested lists is much faster than indexing an array
+        # Like a networkx graph built from the matrix, pairs of gushers with zero distance have no edge
+        self._edges = distances != 0
+        # Distances along each edge, so that distance() raises KeyError for unconnected pairs as the graph would
+        self._edge_distances = {name: {self._names[j]: row[j] for j in self._edges[i].nonzero()[0]}
+                                for i, (name, row) in enumerate(zip(self._names, self._distance_rows))}
 
     def _validate_distances(self):
         violations = self._find_triangle_inequality_violations()
         if violations:
             warnings.warn(f"Distances matrix for map '{self.map_id}' does not satisfy triangle inequality:\n" +
-                          ''.join(f"    {t[0]}->{t[1]}->{t[2]} ({t[3]:g}) is shorter than {t[0]}->{t[2]} ({t[4]}:g)\n"
+                          ''.join(f"    {t[0]}->{t[1]}->{t[2]} ({t[3]:g}) is shorter than {t[0]}->{t[2]} ({t[4]:g})\n"
                                   for t in violations))
 
-    def _load_connections(self, filename):
-        # Read the map name from the first line of the file
-        with open(filename) as f:
-            self.name = f.readline().strip(COMMENT_CHAR + ' \n')
-        connections_raw = nx.read_adjlist(filename, comments=COMMENT_CHAR)
-        conn_size = len(connections_raw)
-        dist_size = len(self.distances)
-        assert dist_size == conn_size + 1, f"Couldn't read {filename}\n" + \
-                                           f"Distances matrix is {dist_size}x{dist_size} " + \
-                                           f"but connections graph has {conn_size} vertices"
-        self.connections = self.distances.edge_subgraph(connections_raw.to_directed(as_view=True).edges)
-        # There's probably some way to induce a subgraph of 'distances' by reading edges directly from connections.txt,
-        #   but I'm too lazy to figure out what that is
+    def _load_connections(self, adjacency):
+        adjacency = adjacency & self._edges
+        self._adjacency = adjacency
+        # Gushers (in file order) and their neighbors, in the same form as a networkx adjacency view
+        self._gushers = [name for i, name in enumerate(self._names) if adjacency[i].any()]
+        self._adj = {name: {self._names[j]: {'weight': self._distance_rows[i][j]} for j in adjacency[i].nonzero()[0]}
+                     for i, name in enumerate(self._names) if name in self._gushers}
+        # Integer bitmasks for fast set operations on gushers, with one bit per gusher
+        self._bits = {name: 1 << i for i, name in enumerate(self._gushers)}
+        self._adj_masks = {name: sum(self._bits[neighbor] for neighbor in neighbors)
+                           for name, neighbors in self._adj.items()}
+
+    def _lookup_groups(self, groups_dict, kind):
+        """Assign each gusher the value of the first group containing it, or the default value."""
+        if not isinstance(groups_dict, dict) or DEFAULT_CHAR not in groups_dict:
+            raise ValueError(f"{kind.capitalize()} for map '{self.map_id}' must be a dictionary with a default value "
+                             f"for '{DEFAULT_CHAR}': {groups_dict!r}")
+        for group, value in groups_dict.items():
+            if not isinstance(group, str) or isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{kind.capitalize()} for map '{self.map_id}' must map strings of gushers to numbers: "
+                                 f"{groups_dict!r}")
+        values = dict()
+        for gusher in self._gushers:
+            value = groups_dict[DEFAULT_CHAR]
+            for group in groups_dict:
+                if gusher in group:
+                    value = groups_dict[group]
+                    break
+            values[gusher] = value
+        return values
 
     def _load_weights(self, weights_dict):
         self.weights = {BASKET_LABEL: 0}
-        for gusher in self.connections:
-            gusher_weight = weights_dict[DEFAULT_CHAR]
-            for group in weights_dict:
-                if gusher in group:
-                    gusher_weight = weights_dict[group]
-                    break
-            self.weights[gusher] = gusher_weight
+        self.weights.update(self._lookup_groups(weights_dict, 'weights'))
+
+    def _load_priors(self, priors_dict):
+        # Priors are relative, so they don't need to add up to 1
+        self.priors = {BASKET_LABEL: 0}
+        self.priors.update(self._lookup_groups(priors_dict, 'priors'))
+        if any(prior < 0 for prior in self.priors.values()) or not any(self.priors.values()):
+            raise ValueError(f"Priors for map '{self.map_id}' must be non-negative and not all zero: {priors_dict}")
 
     def _find_triangle_inequality_violations(self):
-        def distance(start, end):
-            return self.distances.adj[start][end]['weight']
-        violations = set()
-        for vertex in self.distances:
-            neighborhood = set(self.distances.adj[vertex])
-            for neighbor in neighborhood:
-                shortest_distance = distance(vertex, neighbor)
-                for other in neighborhood.difference({neighbor}):
-                    other_distance = distance(vertex, other) + distance(other, neighbor)
-                    if other_distance < shortest_distance:
-                        violations.add((vertex, other, neighbor, other_distance, shortest_distance))
-        return violations
+        # via[i, k, j] is the distance from i to j when going through k
+        d, edges = self._distances, self._edges
+        via = d[:, :, newaxis] + d[newaxis, :, :]
+        found = edges[:, :, newaxis] & edges[newaxis, :, :] & edges[:, newaxis, :] & (via < d[:, newaxis, :])
+        return {(self._names[i], self._names[k], self._names[j], via[i, k, j], d[i, j])
+                for i, k, j in zip(*found.nonzero())}
+
+    @property
+    def distances(self):
+        """networkx DiGraph of distances between all gushers, including the basket."""
+        if self._distances_graph is None:
+            self._distances_graph = nx.from_numpy_array(self._distances, create_using=nx.DiGraph)
+            nx.relabel_nodes(self._distances_graph, dict(enumerate(self._names)), False)
+        return self._distances_graph
+
+    @property
+    def connections(self):
+        """networkx DiGraph of connections between gushers, a subgraph of distances."""
+        if self._connections_graph is None:
+            self._connections_graph = self.distances.edge_subgraph(
+                (self._names[i], self._names[j]) for i, j in zip(*self._adjacency.nonzero()))
+        return self._connections_graph
 
     def __len__(self):
-        return len(self.connections)
+        return len(self._gushers)
 
     def __iter__(self):
-        return self.connections.__iter__()
+        return iter(self._gushers)
 
     def __contains__(self, item):
-        return item in self.connections
+        return item in self._adj
 
     def distance(self, start, end):
-        """Return distance between two gushers."""
-        return self.distances.adj[start][end]['weight']
+        """Return distance between two gushers. Raises KeyError if they aren't connected."""
+        return self._edge_distances[start][end]
 
     def weight(self, vertex):
         """Return the weight of a gusher."""
         return self.weights[vertex]
 
+    def prior(self, vertex):
+        """Return the relative probability of the Goldie being in a gusher."""
+        return self.priors[vertex]
+
+    def expected(self, costs):
+        """Return the mean and standard deviation of a dict of costs for each gusher, weighted by their priors."""
+        total_prior = sum(self.priors[gusher] for gusher in costs)
+        avg = sum(self.priors[gusher]*cost for gusher, cost in costs.items()) / total_prior
+        variance = sum(self.priors[gusher]*(cost - avg)**2 for gusher, cost in costs.items()) / total_prior
+        return avg, variance**0.5
+
     def adj(self, vertex):
         """Return adjacent gushers for a given gusher."""
-        return self.connections.adj[vertex]
+        return self._adj[vertex]
+
+    def fingerprint(self):
+        """Return a hash of everything that affects strategy costs: gushers, distances, connections, weights and
+        priors."""
+        digest = hashlib.sha1()
+        digest.update(repr(self._names).encode())
+        digest.update(self._distances.tobytes())
+        digest.update(self._adjacency.tobytes())
+        digest.update(repr(sorted(self.weights.items())).encode())
+        digest.update(repr(sorted(self.priors.items())).encode())
+        return digest.hexdigest()
+
+    def bit(self, vertex):
+        """Return the bitmask for a single gusher."""
+        return self._bits[vertex]
+
+    def mask(self, vertices=None):
+        """Return the bitmask for a collection of gushers, or for all gushers if none are given."""
+        return sum(self._bits[vertex] for vertex in (self._gushers if vertices is None else vertices))
+
+    def adj_mask(self, vertex):
+        """Return the bitmask of adjacent gushers for a given gusher."""
+        return self._adj_masks[vertex]
+
+    def unmask(self, mask):
+        """Return the gushers in a bitmask."""
+        return [gusher for gusher in self._gushers if mask & self._bits[gusher]]
 
     def degree(self, vertex):
         """Return the number of adjacent gushers for a given gusher."""
-        return self.connections.degree[vertex]
-
-    def plot(self, strategy=None, tuning=0.5):
-        background = plt.imread(str(self._path.parent.parent.resolve()/f'images/{self.map_id}.png'))
-        pos = {gusher['name']: tuple(gusher['coord']) for gusher in self._gushers if gusher['name'] != BASKET_LABEL}
-        pos_attrs = {node: (coord[0] - 40, coord[1]) for (node, coord) in pos.items()}
-
-        if self.map_id in EXTENTS:
-            x, y, length = EXTENTS[self.map_id]
-            extent = [x, x+length, y+length, y]
-            background = background[y:y+length, x:x+length]
-        else:
-            extent = None
+        # Counts both directions of each connection, like the degree of a networkx DiGraph
+        return 2*len(self._adj[vertex])
+
+    def _plot_positions(self):
+        """Return positions of gushers and of their weight labels on the map image. Computed once per map."""
+        if not self._positions:
+            pos = {name: tuple(coord) for name, coord in zip(self._names, self._coords) if name != BASKET_LABEL}
+            pos_attrs = {node: (coord[0] - 40, coord[1]) for (node, coord) in pos.items()}
+            self._positions = pos, pos_attrs, nx.to_undirected(self.connections)
+        return self._positions
+
+    def draw(self, ax, strategy=None, tuning=0.5):
+        """Draw the map, and optionally a strategy, onto a matplotlib Axes."""
+        background, extent = _load_background(self.map_id)
+        pos, pos_attrs, undirected = self._plot_positions()
+        pos = dict(pos)
 
-        fig = plt.figure(figsize=(6, 6))
-        ax = plt.subplot()
         ax.set_facecolor('#444444')
-        plt.imshow(background, extent=extent)
-        plt.title(self.name)
-        nx.draw_networkx_edges(nx.to_undirected(self.connections), pos,
+        ax.imshow(background, extent=extent)
+        ax.set_title(self.name)
+        nx.draw_networkx_edges(undirected, pos, ax=ax,
                                edge_color='#888888', style='dashed', width=1.5)
-        nx.draw_networkx_labels(self.connections, pos_attrs, labels={gusher: self.weight(gusher) for gusher in pos},
+        nx.draw_networkx_labels(self.connections, pos_attrs, ax=ax,
+                                labels={gusher: self.weight(gusher) for gusher in pos},
                                 font_weight='bold', font_color='#ff4a4a', horizontalalignment='right')
 
         if strategy:
             latencies, risks = strategy.get_costs(self)
-            key = f"average time: {mean(latencies.values()):0.2f}, worst time: {max(latencies.values()):0.2f}\n" \
-                  f"average risk: {mean(risks.values()):0.2f}, worst risk: {max(risks.values()):0.2f}"
+            (avg_time, _), (avg_risk, _) = self.expected(latencies), self.expected(risks)
+            key = f"average time: {avg_time:0.2f}, worst time: {max(latencies.values()):0.2f}\n" \
+                  f"average risk: {avg_risk:0.2f}, worst risk: {max(risks.values()):0.2f}"
             if tuning is not None:
                 key = f"setting: {100*(1 - tuning):g}% speed, {100*tuning:g}% safety\n" + key
             # https://stackoverflow.com/a/32745842
@@ -224,18 +416,53 @@ class GusherMap:
             color_kwargs = ({'edgelist':  high_edges, 'edge_color': high_colors, 'edge_cmap': high_cmap},
                             {'edgelist': low_edges, 'edge_color': low_colors, 'edge_cmap': low_cmap})
             for kwargs in color_kwargs:
-                nx.draw_networkx_edges(strat_graph, pos,
+                nx.draw_networkx_edges(strat_graph, pos, ax=ax,
                                        width=2, connectionstyle='arc3, rad=0.25', min_target_margin=12,
                                        arrowstyle='simple, head_length=1.2, head_width=1.2', **kwargs)
 
-            nx.draw_networkx_nodes(strat_graph, pos, node_color=node_colors)
+            nx.draw_networkx_nodes(strat_graph, pos, ax=ax, node_color=node_colors)
         else:
-            nx.draw_networkx_nodes(self.connections, pos, node_color='#ffffff')
+            nx.draw_networkx_nodes(self.connections, pos, ax=ax, node_color='#ffffff')
 
-        nx.draw_networkx_labels(self.connections, pos, labels={gusher: gusher for gusher in pos}, font_color='#111111')
+        nx.draw_networkx_labels(self.connections, pos, ax=ax, labels={gusher: gusher for gusher in pos},
+                                font_color='#111111')
 
+    def plot(self, strategy=None, tuning=0.5):
+        """Show the map, and optionally a strategy, in a window."""
+        fig = plt.figure(figsize=FIGURE_SIZE)
+        self.draw(fig.add_subplot(111), strategy, tuning)
         plt.show()
 
+    def render(self, strategies, paths, tuning=0.5, dpi=None):
+        """Save an image of each strategy to the corresponding path without opening any windows.
+        The file format is taken from the path's extension (e.g. .png or .svg). A single figure is reused for all of
+        the images."""
+        fig = Figure(figsize=FIGURE_SIZE)
+        ax = fig.add_subplot(111)
+        for strategy, path in zip(strategies, paths):
+            ax.clear()
+            self.draw(ax, strategy, tuning)
+            fig.savefig(str(path), dpi=dpi)
+
+
+@lru_cache(maxsize=None)
+def _load_background(map_id):
+    """Return the cropped background image for a map and its extent. Cached so each image is only read once."""
+    background = plt.imread(str(IMAGES_PATH/f'{map_id}.png'))
+    if map_id in EXTENTS:
+        x, y, length = EXTENTS[map_id]
+        extent = [x, x+length, y+length, y]
+        background = background[y:y+length, x:x+length]
+    else:
+        extent = None
+    return background, extent
+
+
+@lru_cache(maxsize=MAP_CACHE_SIZE)
+def load_map(map_id, weights=None, squad=False, priors=None):
+    """Load a GusherMap, reusing it if it has already been loaded in this process with the same settings."""
+    return GusherMap(map_id, weights=weights, squad=squad, priors=priors)
+
 
 # TODO - move to separate test file
 if __name__ == '__main__':
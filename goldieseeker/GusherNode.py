@@ -1,4 +1,5 @@
 from .GusherMap import BASKET_LABEL
+import re
 from copy import deepcopy
 from statistics import mean
 from statistics import pstdev
@@ -19,10 +20,15 @@ class GusherNode:
         # if findable is False, the gusher is being opened solely for information (e.g. gusher G on Ark Polaris)
         # non-findable nodes still count towards their children's costs, but don't count towards tree's objective score
         self.size = 1 if findable else 0  # number of findable nodes in subtree rooted at this node
+        if gusher_map:
+            self.prior = gusher_map.prior(name)  # relative probability of the Goldie being in this gusher
+        else:
+            self.prior = 1
+        self.mass = self.prior if findable else 0  # sum of priors of findable nodes in subtree rooted at this node
         self.distance = 1  # distance from parent gusher
         self.latency = 0  # if Goldie is in this gusher, how long it takes to find Goldie by following decision tree
         # latency = total distance traveled on the path from root node to this node
-        self.total_latency = 0  # sum of latencies of this node's findable descendants
+        self.total_latency = 0  # sum of latencies of this node's findable descendants, weighted by their priors
         if gusher_map:
             self.weight = gusher_map.weight(name)  # risk weight for this gusher
         else:
@@ -31,7 +37,7 @@ class GusherNode:
         # Trash spawned by a given gusher is multiplied by the gusher's weight
         # This does not mean the gusher actually spawns more fish; it is just a way of telling the algorithm that
         #   some gushers spawn more dangerous trash than others (e.g. gushers next to basket)
-        self.total_risk = 0  # sum of risks of this node's findable descendants
+        self.total_risk = 0  # sum of risks of this node's findable descendants, weighted by their priors
 
     def __str__(self):
         return self.name + (NEVER_FIND_FLAG if not self.findable else "")
@@ -58,13 +64,16 @@ class GusherNode:
     def __eq__(self, other):
         return isinstance(other, GusherNode) and write_tree(self) == write_tree(other)
 
-    # Override deepcopy so that it does not copy non-root nodes' cost attributes (weight, size, latency, etc.)
+    # Override deepcopy so that it does not copy non-root nodes' cost attributes (size, latency, etc.)
     # This improves performance without sacrificing any accuracy
+    # Weights and priors are always copied, since they are needed to recalculate the costs of non-root nodes
     # noinspection PyDefaultArgument
     def __deepcopy__(self, memodict={}):
         tree_copy = GusherNode(self.name, findable=self.findable)
+        tree_copy.weight = self.weight
+        tree_copy.prior = self.prior
         if not self.parent:
-            cost_attrs = ('size', 'distance', 'latency', 'total_latency', 'weight', 'risk', 'total_risk')
+            cost_attrs = ('size', 'mass', 'distance', 'latency', 'total_latency', 'risk', 'total_risk')
             tree_copy.__dict__.update({attr: self.__dict__.get(attr) for attr in cost_attrs})
         if self.high:
             tree_copy.high = deepcopy(self.high)
@@ -76,6 +85,7 @@ class GusherNode:
 
     def add_children(self, high, low, dist_h=1, dist_l=1):
         size_h, size_l = 0, 0
+        mass_h, mass_l = 0, 0
         totlat_h, totlat_l = 0, 0
         totrisk_h, totrisk_l = 0, 0
         if high:
@@ -85,6 +95,7 @@ class GusherNode:
             self.high.parent = self
             self.high.distance = dist_h
             size_h = self.high.size
+            mass_h = self.high.mass
             totlat_h = self.high.total_latency
             totrisk_h = self.high.total_risk
         if low:
@@ -94,10 +105,12 @@ class GusherNode:
             self.low.parent = self
             self.low.distance = dist_l
             size_l = self.low.size
+            mass_l = self.low.mass
             totlat_l = self.low.total_latency
             totrisk_l = self.low.total_risk
         self.size = size_l + size_h + (1 if self.findable else 0)
-        self.total_latency = totlat_l + dist_l*size_l + totlat_h + dist_h*size_h
+        self.mass = mass_l + mass_h + (self.prior if self.findable else 0)
+        self.total_latency = totlat_l + dist_l*mass_l + totlat_h + dist_h*mass_h
         self.total_risk = totrisk_l + totrisk_h + self.weight*self.total_latency
 
     def findable_nodes(self):
@@ -118,7 +131,7 @@ class GusherNode:
                 # Latency of root node is distance between start (i.e. basket) and root node
                 if gusher_map:
                     node.latency = gusher_map.distance(start, node.name)
-                    node.total_latency += node.latency*node.size
+                    node.total_latency += node.latency*node.mass
                 else:
                     node.latency = 0
                 node.risk = 0
@@ -135,56 +148,25 @@ class GusherNode:
         self.update_costs(gusher_map, start)
         self.total_latency, self.total_risk = 0, 0
         for node in self.findable_nodes():
-            self.total_latency += node.latency
-            self.total_risk += node.risk
+            self.total_latency += node.prior*node.latency
+            self.total_risk += node.prior*node.risk
 
     def validate(self, gusher_map=None):
-        """Check that tree is a valid strategy tree."""
-        def recurse(node, predecessors, possible_nodes):
-            # can't open the same gusher twice
-            if node.name in predecessors:
-                raise ValidationError(node, f'gusher {node} already in set of opened gushers: {predecessors}')
-
-            if possible_nodes:
-                if node.name in possible_nodes:
-                    possible_nodes.remove(node.name)
-                    if not node.findable:
-                        raise ValidationError(node, f'gusher {node} is incorrectly marked non-findable, '
-                                                    f'should be {node.name}')
-                elif node.name not in possible_nodes and node.findable:
-                    raise ValidationError(node, f'gusher {node} is incorrectly marked findable, '
-                                                f'should be {node.name + NEVER_FIND_FLAG}')
-
-            if node.high or node.low:
-                if not possible_nodes:
-                    raise ValidationError(node, f'Goldie should have been found after opening gusher {node}')
-                pred_new = predecessors.union({node.name})
-                if gusher_map:
-                    neighborhood = set(gusher_map.adj(node.name))
-                else:
-                    neighborhood = set()
-
-                # make sure parent/child references are consistent
-                if node.high:
-                    assert node.high.parent is node, f'node = {node}, node.high = {node.high}, ' \
-                                                     f'node.high.parent = {node.high.parent}'
-                    recurse(node.high, pred_new, possible_nodes.intersection(neighborhood))
-                if node.low:
-                    assert node.low.parent is node, f'node = {node}, node.low = {node.low}, ' \
-                                                    f'node.low.parent = {node.low.parent}'
-                    recurse(node.low, pred_new, possible_nodes.difference(neighborhood))
-            else:
-                # reaching a leaf node must guarantee that the Goldie will be found
-                if possible_nodes:
-                    raise ValidationError(node, f'Goldie could still be in gushers {possible_nodes} '
-                                                f'after opening gusher {node}')
-
-        if gusher_map:
-            unaccounted = set(gusher_map).difference(node.name for node in self.findable_nodes())
-            if unaccounted:
-                raise ValidationError(self, 'Strategy is not guaranteed to find Goldie if hiding in gushers ' +
-                                            ', '.join(unaccounted))
-        recurse(self, set(), set(gusher_map) if gusher_map else set())
+        """Check that tree is a valid strategy tree, raising a ValidationError for the first problem found."""
+        errors = self.find_errors(gusher_map)
+        if errors:
+            raise errors[0]
+
+    def find_errors(self, gusher_map=None):
+        """Check that tree is a valid strategy tree and return a list of ValidationErrors for every problem found.
+        Sets of gushers are represented as integer bitmasks, so the whole tree is checked in a single pass.
+        A map is needed to tell which gushers are connected, so gusher_map is required despite its default."""
+        if gusher_map is None:
+            raise ValueError('A GusherMap is needed to validate a strategy tree')
+        # make sure parent/child references are consistent
+        errors = [ValidationError(child, f'node {child} has parent {child.parent}, expected {node}')
+                  for node in self for child in (node.high, node.low) if child and child.parent is not node]
+        return errors + _find_errors(self, gusher_map, gusher_map.mask())
 
     def get_costs(self, gusher_map=None):
         self.update_costs(gusher_map)
@@ -199,8 +181,14 @@ class GusherNode:
         latencies, risks = self.get_costs(gusher_map)
         cost_long = f"times: {{{', '.join(f'{node}: {time:0.2f}' for node, time in sorted(latencies.items()))}}}\n"\
                     f"risks: {{{', '.join(f'{node}: {risk:0.2f}' for node, risk in sorted(risks.items()))}}}\n"
-        cost_short = f"avg. time: {mean(latencies.values()):0.2f} +/- {pstdev(latencies.values()):0.2f}\n"\
-                     f"avg. risk: {mean(risks.values()):0.2f} +/- {pstdev(risks.values()):0.2f}"
+        if gusher_map:
+            # Averages are weighted by the chance of the Goldie being in each gusher
+            (avg_time, std_time), (avg_risk, std_risk) = gusher_map.expected(latencies), gusher_map.expected(risks)
+        else:
+            avg_time, std_time = mean(latencies.values()), pstdev(latencies.values())
+            avg_risk, std_risk = mean(risks.values()), pstdev(risks.values())
+        cost_short = f"avg. time: {avg_time:0.2f} +/- {std_time:0.2f}\n"\
+                     f"avg. risk: {avg_risk:0.2f} +/- {std_risk:0.2f}"
 
         output = short_str
         if quiet < 3:
@@ -237,6 +225,139 @@ class ValidationError(Exception):
         super().__init__(node, message)
 
 
+def _find_errors(root, gusher_map, all_gushers):
+    # Works on any tree of nodes with name, findable, high and low attributes (GusherNodes or _StrategyNodes)
+    # all_gushers is gusher_map.mask(), passed in so that batches only compute it once
+    def names(mask):
+        return ', '.join(gusher_map.unmask(mask))
+
+    errors = []
+    unaccounted = all_gushers
+    for node in root:
+        if node.findable and node.name in gusher_map:
+            unaccounted &= ~gusher_map.bit(node.name)
+    if unaccounted:
+        errors.append(ValidationError(root, 'Strategy is not guaranteed to find Goldie if hiding in gushers ' +
+                                            names(unaccounted)))
+
+    # Each entry is (node, mask of gushers opened before it, mask of gushers that could still have the Goldie)
+    stack = [(root, 0, all_gushers)]
+    while stack:
+        node, opened, suspected = stack.pop()
+        if node.name not in gusher_map:
+            errors.append(ValidationError(node, f"Couldn't find gusher {node.name}"))
+            continue
+        bit = gusher_map.bit(node.name)
+        # can't open the same gusher twice
+        if opened & bit:
+            errors.append(ValidationError(node, f'gusher {node} already in set of opened gushers: {names(opened)}'))
+
+        if suspected:
+            if suspected & bit:
+                suspected &= ~bit
+                if not node.findable:
+                    errors.append(ValidationError(node, f'gusher {node} is incorrectly marked non-findable, '
+                                                        f'should be {node.name}'))
+            elif node.findable:
+                errors.append(ValidationError(node, f'gusher {node} is incorrectly marked findable, '
+                                                    f'should be {node.name + NEVER_FIND_FLAG}'))
+
+        if node.high or node.low:
+            if not suspected:
+                errors.append(ValidationError(node, f'Goldie should have been found after opening gusher {node}'))
+                continue
+            opened |= bit
+            neighborhood = gusher_map.adj_mask(node.name)
+            # push low first so that high subtrees are checked first, as in write_tree()
+            if node.low:
+                stack.append((node.low, opened, suspected & ~neighborhood))
+            if node.high:
+                stack.append((node.high, opened, suspected & neighborhood))
+        elif suspected:
+            # reaching a leaf node must guarantee that the Goldie will be found
+            errors.append(ValidationError(node, f'Goldie could still be in gushers {names(suspected)} '
+                                                f'after opening gusher {node}'))
+    return errors
+
+
+class _StrategyNode:
+    """Bare strategy tree node with no costs, read by _read_strategy() for validating strategies in bulk."""
+    __slots__ = ('name', 'findable', 'high', 'low')
+
+    def __init__(self, name, findable=True):
+        self.name = name
+        self.findable = findable
+        self.high = None
+        self.low = None
+
+    def __str__(self):
+        return self.name + (NEVER_FIND_FLAG if not self.findable else "")
+
+    def __iter__(self):
+        yield self
+        if self.high:
+            yield from self.high.__iter__()
+        if self.low:
+            yield from self.low.__iter__()
+
+
+# Tokens of a strategy string: a gusher name with an optional flag, or any other single character
+_STRATEGY_TOKEN = re.compile(rf'(\w+)([{NEVER_FIND_FLAG}]?)|(\S)')
+
+
+def _read_strategy(tree_str):
+    """Parse a strategy string into a tree of _StrategyNodes, accepting the same strings as the pyparsing grammar.
+    Much faster than read_tree(), since it doesn't look anything up in the map or calculate any costs."""
+    tokens = list(_STRATEGY_TOKEN.finditer(tree_str))
+
+    def expect(i, char):
+        if i >= len(tokens) or tokens[i].group(3) != char:
+            found = f"'{tokens[i].group()}'" if i < len(tokens) else 'end of string'
+            raise ValueError(f"Expected '{char}', found {found}")
+        return i + 1
+
+    def parse_subtree(i):  # returns (subtree or None, index of next token)
+        if i < len(tokens) and tokens[i].group(1):
+            return parse_tree(i)
+        return None, i
+
+    def parse_tree(i):
+        if i >= len(tokens) or not tokens[i].group(1):
+            found = f"'{tokens[i].group()}'" if i < len(tokens) else 'end of string'
+            raise ValueError(f"Expected gusher name, found {found}")
+        root = _StrategyNode(tokens[i].group(1), findable=not tokens[i].group(2))
+        i += 1
+        if i < len(tokens) and tokens[i].group(3) == '(':
+            root.high, i = parse_subtree(i + 1)
+            i = expect(i, ',')
+            root.low, i = parse_subtree(i)
+            i = expect(i, ')')
+        return root, i
+
+    root, end = parse_tree(0)
+    if end < len(tokens):
+        raise ValueError(f"Unexpected '{tokens[end].group()}' after end of strategy")
+    return root
+
+
+def validate_batch(strategies, gusher_map):
+    """Check many strategies (trees or strings) against the same map.
+    Returns a list with the ValidationErrors found for each strategy; an empty list means the strategy is valid.
+    Strings are checked without building GusherNodes or calculating costs, so errors found in them refer to bare
+    nodes that only have a name, flag and children."""
+    all_gushers = gusher_map.mask()
+    results = []
+    for strategy in strategies:
+        if not isinstance(strategy, GusherNode):
+            try:
+                strategy = _read_strategy(strategy)
+            except ValueError as err:
+                results.append([ValidationError(None, f"Couldn't read strategy {strategy}: {err}")])
+                continue
+        results.append(_find_errors(strategy, gusher_map, all_gushers))
+    return results
+
+
 def write_tree(root):
     """Write the strategy encoded by the subtree rooted at 'root' in modified Newick format.
     V(H, L) represents the tree with root node V, high subtree H, and low subtree L.
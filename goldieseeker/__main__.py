@@ -1,10 +1,11 @@
 import click
 import pathlib
-from os import scandir
 from . import __version__
-from .GusherMap import GusherMap
+from .GusherMap import GusherMap, map_ids
 from .GusherNode import read_tree
-from .strats import get_strat
+from .strats import get_strat, get_top_strats
+from .simulation import simulate, simulate_many, lognormal_noise
+from .server import DEFAULT_PORT, serve as run_server
 
 
 # TODO - start compilation of strategy variants for each gushers
@@ -13,12 +14,11 @@ from .strats import get_strat
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 # Get list of available map IDs
-HERE = pathlib.Path(__file__).parent.resolve()
-maps = [f.name for f in scandir(HERE/'maps/') if f.is_dir()]
+maps = map_ids()
 
 
 @click.command(context_settings=CONTEXT_SETTINGS)
-@click.option('--map', '-m', 'map_id', required=True,
+@click.option('--map', '-m', 'map_id',
               type=click.Choice(maps, case_sensitive=False),
               help="""Map ID. Must be the name of a folder in 'goldieseeker/maps'.""")
 @click.option('--tuning', '-t', type=click.FloatRange(0, 1), default=0.5,
@@ -35,39 +35,105 @@ maps = [f.name for f in scandir(HERE/'maps/') if f.is_dir()]
               Evaluate a user-specified strategy.
               example: -E "f(d(b, g), e(c, a))"
               "a(b, c)" means "if A is high, open B, and if A is low, open C\"""")
+@click.option('--top', '-k', type=click.IntRange(1), default=1,
+              help="""\b
+              Generate the K best strategies instead of only the best one.
+              Useful when the best strategy is impractical to execute.""")
 @click.option('--weights', '-W', type=str,
               help="""\b
               Specify custom gusher weights in dictionary format.
               example: -W "{'d': 4, 'bef': 2, '.': 1}"
               This gives a weight of 4 to gusher D, a weight of 2 to gushers B, E, and F, """
               "and a weight of 1 to the rest.")
+@click.option('--priors', '-P', type=str,
+              help="""\b
+              Specify how likely the Goldie is to be in each gusher, in dictionary format.
+              example: -P "{'ab': 3, '.': 1}"
+              This makes gushers A and B each 3 times as likely as any other gusher.""")
+@click.option('--simulate', '-S', 'trials', type=click.IntRange(1),
+              help="""\b
+              Simulate the strategy over this many runs with randomly varying travel times,
+              and report the distributions of time and risk.
+              With --top, each of the K strategies is simulated.""")
+@click.option('--noise', '-N', type=click.FloatRange(0), default=0.2, show_default=True,
+              help="How much travel times vary from trip to trip when simulating (log-normal sigma).")
 @click.option('--quiet', '-q', count=True,
               help="""\b
               Don't show the map plot.
               Use '-qq' to also suppress reporting strategy details.
               Use '-qqq' to only output the string representation of the strategy tree.""")
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True),
+              help="""\b
+              Save the map plot to a file instead of showing it (format taken from the extension, e.g. .png or .svg).
+              With --top, the K strategies are saved to numbered files, e.g. 'strat-1.png', 'strat-2.png', ...""")
+@click.option('--serve', is_flag=True,
+              help="""\b
+              Run a local JSON-over-HTTP solver server instead of solving a single map.
+              Keeps maps and solved strategies in memory between requests.""")
+@click.option('--port', type=click.IntRange(1, 65535), default=DEFAULT_PORT, show_default=True,
+              help="Port for the solver server to listen on.")
 @click.option('--debug', '-d', is_flag=True,
               help="Print internal process of search algorithm.")
 @click.version_option(__version__, '--version', '-v', prog_name="goldieseeker")
-def main(map_id, tuning, squad, strategy_str, weights, quiet, debug):
+def main(map_id, tuning, squad, strategy_str, top, weights, priors, trials, noise, quiet, output, serve, port, debug):
     """\b
     For a given map, generate a Goldie Seeking strategy or evaluate a user-specified strategy.
-    To customize default distances and weights, edit the corresponding files in goldieseeker/maps/[MAP_ID]."""
+    To customize default distances, weights, and priors, edit the corresponding files in goldieseeker/maps/[MAP_ID]."""
+    if serve:
+        run_server(port=port)
+        return
+    if not map_id:
+        raise click.UsageError("Missing option '--map' / '-m'.")
+    if strategy_str and top > 1:
+        raise click.UsageError("'--top' / '-k' can't be used with '--eval' / '-E'.")
+    if debug and (strategy_str or top > 1):
+        raise click.UsageError("'--debug' / '-d' only works when generating a single strategy.")
     try:
-        gusher_map = GusherMap(map_id, weights=weights, squad=squad)
+        gusher_map = GusherMap(map_id, weights=weights, squad=squad, priors=priors)
     except IOError as err:
         click.echo(f"Couldn't load map '{map_id}'!", err=True)
         click.echo(str(err), err=True)
+    except (ValueError, SyntaxError, KeyError, TypeError) as err:
+        click.echo(f"Couldn't load map '{map_id}' with weights {weights} and priors {priors}!", err=True)
+        click.echo(f"{type(err).__name__}: {err}", err=True)
     else:
         if strategy_str:
             strat = read_tree(strategy_str, gusher_map)
             strat.validate(gusher_map)
+            strats = [strat]
+        elif top > 1:
+            ranked = get_top_strats(gusher_map, k=top, tuning=tuning)
+            for rank, (score, strat) in enumerate(ranked, 1):
+                if quiet < 3:
+                    click.echo(f"#{rank} (score: {score:0.2f})")
+                click.echo(strat.report(gusher_map, quiet=quiet))
+            strats = [strat for _, strat in ranked]
+            strat = strats[0]
         else:
             strat = get_strat(gusher_map, tuning=tuning, debug=debug)
             # strat.validate(gusher_map)
-        click.echo(strat.report(gusher_map, quiet=quiet))
-        if quiet < 1:
-            gusher_map.plot(strat, tuning if not strategy_str else None)
+            strats = [strat]
+        if strategy_str or top == 1:
+            click.echo(strat.report(gusher_map, quiet=quiet))
+        if trials and quiet < 3:
+            if len(strats) > 1:
+                # Same seed for every strategy, so that their results are directly comparable
+                results = simulate_many(strats, gusher_map, noise=lognormal_noise(noise), trials=trials)
+                for rank, result in enumerate(results, 1):
+                    click.echo(f"#{rank} {result.strategy}")
+                    click.echo(result.report(quiet=quiet))
+            else:
+                click.echo(simulate(strat, gusher_map, noise=lognormal_noise(noise), trials=trials).report(quiet=quiet))
+        plot_tuning = tuning if not strategy_str else None
+        if output:
+            path = pathlib.Path(output)
+            if len(strats) > 1:
+                paths = [path.with_name(f'{path.stem}-{rank}{path.suffix}') for rank in range(1, len(strats) + 1)]
+            else:
+                paths = [path]
+            gusher_map.render(strats, paths, plot_tuning)
+        elif quiet < 1:
+            gusher_map.plot(strat, plot_tuning)
 
 
 if __name__ == '__main__':
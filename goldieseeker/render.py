@@ -0,0 +1,39 @@
+import os
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from .GusherMap import load_map
+from .GusherNode import GusherNode, read_tree, write_tree
+
+# One image to render: a strategy (tree or string) on a map, saved to 'path' in the format given by its extension
+# As in GusherMap.render(), tuning defaults to 0.5; pass tuning=None for strategies that weren't solved with a tuning
+RenderJob = namedtuple('RenderJob', 'map_id strategy path tuning weights squad priors')
+RenderJob.__new__.__defaults__ = (0.5, None, False, None)
+
+
+def _render_chunk(map_id, weights, squad, priors, tuning, strategies, paths):
+    gusher_map = load_map(map_id, weights, squad, priors)
+    gusher_map.render((read_tree(strategy, gusher_map) for strategy in strategies), paths, tuning)
+    return paths
+
+
+def render_batch(jobs, processes=None):
+    """Render many strategy images in parallel worker processes, without opening any windows.
+    Jobs with the same map settings are split into one chunk per process, so that each worker loads the map and sets
+    up a figure only once per chunk. Returns the paths of the rendered images."""
+    groups = defaultdict(list)
+    for job in jobs:
+        strategy = write_tree(job.strategy) if isinstance(job.strategy, GusherNode) else job.strategy
+        groups[(job.map_id, job.weights, job.squad, job.priors, job.tuning)].append((strategy, str(job.path)))
+
+    processes = processes or os.cpu_count() or 1
+    rendered = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = []
+        for settings, group in groups.items():
+            chunk_size = -(-len(group) // processes)
+            for i in range(0, len(group), chunk_size):
+                strategies, paths = zip(*group[i:i + chunk_size])
+                futures.append(executor.submit(_render_chunk, *settings, strategies, paths))
+        for future in futures:
+            rendered.extend(future.result())
+    return rendered
@@ -0,0 +1,228 @@
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from pyparsing import ParseBaseException
+from .GusherMap import load_map, map_ids
+from .GusherNode import read_tree, write_tree
+from .strats import get_strat, get_top_strats, tree_score
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8347
+
+STRAT_CACHE_SIZE = 1024  # number of solved strategies kept by the server
+MAX_TOP = 50  # largest number of strategies that can be requested at once
+MAX_BODY_SIZE = 64*1024
+
+
+class RequestError(Exception):
+    """Error caused by a bad request; reported to the client with the given HTTP status."""
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+def solve(map_id, weights, squad, priors, tuning, top):
+    """Solve a map and return the strategies as (score, strategy string) pairs. Runs in a worker process."""
+    gusher_map = load_map(map_id, weights, squad, priors)
+    if top > 1:
+        strats = get_top_strats(gusher_map, k=top, tuning=tuning)
+    else:
+        strat = get_strat(gusher_map, tuning=tuning)
+        strats = [(tuning*strat.total_risk + (1 - tuning)*strat.total_latency, strat)]
+    return [(score, write_tree(strat)) for score, strat in strats]
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, key, default=None):
+        return self._items.get(key, default)
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+
+class SolverServer:
+    """Long-lived JSON-over-HTTP server that keeps maps and solved strategies in memory.
+    Every endpoint takes a POST request with a JSON object body:
+        /solve   {"map", "tuning", "squad", "weights", "priors", "top"} -> {"strategies": [{"strategy", "score"}, ...]}
+        /eval    {"map", "strategy", "tuning", "squad", "weights", "priors"} -> {"strategy", "valid", "errors", "score",
+                                                                                 "times", "risks"}
+        /report  {"map", "strategy", "tuning", "squad", "weights", "priors", "quiet"} -> {"strategy", "report"}
+    If /report is not given a strategy, it reports the optimal strategy for the given settings.
+    Solves run in a pool of worker processes so that they don't block other requests."""
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+        self.host = host
+        self.port = port
+        self.maps = map_ids()
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.strats = LRUCache(STRAT_CACHE_SIZE)  # solve settings -> future for solved strategies
+        self.routes = {'/solve': self.handle_solve, '/eval': self.handle_eval, '/report': self.handle_report}
+
+    def serve_forever(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(asyncio.start_server(self.handle_connection, self.host, self.port))
+        print(f"goldieseeker server listening on http://{self.host}:{self.port}")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            self.executor.shutdown()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, response = await self.handle_request(reader)
+        except RequestError as err:
+            status, response = err.status, {'error': str(err)}
+        except Exception as err:  # don't let one bad request take down the server
+            status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(err).__name__}: {err}'}
+        body = json.dumps(response).encode()
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise RequestError('Malformed request line')
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        handler = self.routes.get(path.split('?')[0])
+        if not handler:
+            raise RequestError(f'Unknown endpoint {path}', HTTPStatus.NOT_FOUND)
+        if method != 'POST':
+            raise RequestError('Use POST with a JSON body', HTTPStatus.METHOD_NOT_ALLOWED)
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError('Invalid Content-Length') from None
+        if length > MAX_BODY_SIZE:
+            raise RequestError('Request body too large', HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        try:
+            params = json.loads((await reader.readexactly(length)).decode() or '{}')
+        except (ValueError, asyncio.IncompleteReadError):
+            raise RequestError('Request body must be a JSON object') from None
+        if not isinstance(params, dict):
+            raise RequestError('Request body must be a JSON object')
+        return HTTPStatus.OK, await handler(params)
+
+    def parse_settings(self, params):
+        """Read the map settings shared by all endpoints."""
+        map_id = params.get('map')
+        if map_id not in self.maps:
+            raise RequestError(f"Unknown map '{map_id}', expected one of: {', '.join(sorted(self.maps))}")
+        weights, priors = params.get('weights'), params.get('priors')
+        if isinstance(weights, dict):
+            weights = repr(weights)
+        elif weights is not None and not isinstance(weights, str):
+            raise RequestError("'weights' must be a dictionary or a string")
+        if isinstance(priors, dict):
+            priors = repr(priors)
+        elif priors is not None and not isinstance(priors, str):
+            raise RequestError("'priors' must be a dictionary or a string")
+        squad = params.get('squad', False)
+        if not isinstance(squad, bool):
+            raise RequestError("'squad' must be true or false")
+        tuning = params.get('tuning', 0.5)
+        # bool is a subclass of int, so true/false would otherwise pass as numbers
+        if isinstance(tuning, bool) or not isinstance(tuning, (int, float)) or not 0 <= tuning <= 1:
+            raise RequestError("'tuning' must be a number between 0 and 1")
+        try:
+            load_map(map_id, weights, squad, priors)
+        except (ValueError, SyntaxError, KeyError, TypeError) as err:
+            raise RequestError(f"Couldn't load map '{map_id}' with weights {weights} and priors {priors}: {err!r}")\
+                from None
+        return map_id, weights, squad, priors, float(tuning)
+
+    def read_strategy(self, params, gusher_map):
+        if params.get('strategy') is None:
+            raise RequestError("'strategy' is required")
+        try:
+            return read_tree(str(params['strategy']), gusher_map)
+        except (ValueError, ParseBaseException) as err:
+            raise RequestError(f"Couldn't read strategy: {err}") from None
+
+    async def solve(self, map_id, weights, squad, priors, tuning, top=1):
+        """Return solved strategies for the given settings, solving them in a worker process if necessary.
+        Identical requests that arrive while a solve is in progress wait for the same result."""
+        key = (map_id, weights, squad, priors, tuning, top)
+        if key not in self.strats:
+            loop = asyncio.get_event_loop()
+            self.strats[key] = loop.run_in_executor(self.executor, solve, map_id, weights, squad, priors,
+                                                      tuning, top)
+        future = self.strats[key]
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self.strats.get(key) is future:  # don't cache failures
+                self.strats.pop(key)
+            raise
+
+    async def handle_solve(self, params):
+        settings = self.parse_settings(params)
+        top = params.get('top', 1)
+        if isinstance(top, bool) or not isinstance(top, int) or not 1 <= top <= MAX_TOP:
+            raise RequestError(f"'top' must be an integer between 1 and {MAX_TOP}")
+        strats = await self.solve(*settings, top)
+        return {'strategies': [{'strategy': strat, 'score': score} for score, strat in strats]}
+
+    async def handle_eval(self, params):
+        map_id, weights, squad, priors, tuning = self.parse_settings(params)
+        gusher_map = load_map(map_id, weights, squad, priors)
+        strat = self.read_strategy(params, gusher_map)
+        errors = [err.args[1] for err in strat.find_errors(gusher_map)]
+        latencies, risks = strat.get_costs(gusher_map)
+        return {'strategy': write_tree(strat), 'valid': not errors, 'errors': errors,
+                'score': tree_score(strat, gusher_map, tuning),
+                'times': latencies, 'risks': risks}
+
+    async def handle_report(self, params):
+        map_id, weights, squad, priors, tuning = self.parse_settings(params)
+        quiet = params.get('quiet', 1)
+        if isinstance(quiet, bool) or not isinstance(quiet, int):
+            raise RequestError("'quiet' must be an integer")
+        gusher_map = load_map(map_id, weights, squad, priors)
+        if params.get('strategy'):
+            strat = self.read_strategy(params, gusher_map)
+        else:
+            (_, strat_str), = await self.solve(map_id, weights, squad, priors, tuning)
+            strat = read_tree(strat_str, gusher_map)
+        return {'strategy': write_tree(strat), 'report': strat.report(gusher_map, quiet=quiet)}
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    SolverServer(host, port, workers).serve_forever()
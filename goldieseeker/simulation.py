@@ -0,0 +1,157 @@
+import numpy as np
+from .GusherMap import BASKET_LABEL
+from .GusherNode import GusherNode, read_tree, write_tree
+
+# Percentiles and tail fraction reported by SimulationResult.summary()
+PERCENTILES = (50, 90, 99)
+TAIL_FRACTION = 0.05
+
+
+def lognormal_noise(sigma=0.2, trial_sigma=0.1):
+    """Noise model that multiplies every travel distance by a random factor with mean 1.
+    sigma controls how much individual trips vary (e.g. trash in the way), while trial_sigma controls how much the
+    overall pace of a run varies (e.g. player speed), which affects every trip in that run equally."""
+    def sample(rng, distances, trials):
+        # Build the log of the factors in place in single precision; this is much faster than rng.lognormal()
+        factors = rng.standard_normal(size=(trials, len(distances)), dtype=np.float32)
+        factors *= sigma
+        factors -= sigma**2/2
+        if trial_sigma:
+            factors += trial_sigma*rng.standard_normal(size=(trials, 1), dtype=np.float32) - trial_sigma**2/2
+        np.exp(factors, out=factors)
+        factors *= distances
+        return factors
+    return sample
+
+
+def delay_noise(rate=0.1, mean_delay=2.0):
+    """Noise model that adds an occasional delay to each trip, on top of the normal travel distance.
+    Each trip is delayed with probability 'rate', and delays are exponentially distributed."""
+    def sample(rng, distances, trials):
+        delays = rng.standard_exponential(size=(trials, len(distances)), dtype=np.float32)
+        delays *= mean_delay
+        delays *= rng.random(size=(trials, len(distances)), dtype=np.float32) < rate
+        delays += distances
+        return delays
+    return sample
+
+
+def _ancestors(node):
+    node = node.parent
+    while node:
+        yield node
+        node = node.parent
+
+
+class CompiledStrat:
+    """A strategy tree flattened into matrices.
+    Every node of the tree is reached by exactly one trip (from its parent, or from the start for the root), so the
+    time and risk for each Goldie location are linear in the trip distances. One matrix product then evaluates a
+    whole batch of noisy trials at once."""
+    def __init__(self, strategy, gusher_map, start=BASKET_LABEL):
+        if not isinstance(strategy, GusherNode):
+            strategy = read_tree(strategy, gusher_map, start)
+        self.strategy = write_tree(strategy)
+        nodes = list(strategy)
+        index = {id(node): i for i, node in enumerate(nodes)}
+        self.distances = np.array([gusher_map.distance(node.parent.name if node.parent else start, node.name)
+                                   for node in nodes], dtype=np.float32)
+
+        findable = [node for node in nodes if node.findable]
+        self.gushers = [node.name for node in findable]
+        self.priors = np.array([gusher_map.prior(name) for name in self.gushers], dtype=float)
+        self.latency_matrix = np.zeros((len(nodes), len(findable)), dtype=np.float32)
+        self.risk_matrix = np.zeros((len(nodes), len(findable)), dtype=np.float32)
+        for col, node in enumerate(findable):
+            # Walk up from the Goldie's gusher; a trip's risk is scaled by the weights of all gushers opened before it
+            trip = node
+            while trip:
+                predecessor_weight = sum(gusher_map.weight(ancestor.name) for ancestor in _ancestors(trip))
+                self.latency_matrix[index[id(trip)], col] = 1
+                self.risk_matrix[index[id(trip)], col] = predecessor_weight
+                trip = trip.parent
+
+    def __str__(self):
+        return self.strategy
+
+    def costs(self, distances):
+        """Return times and risks for every Goldie location, given trip distances of shape (trials, trips)."""
+        return distances @ self.latency_matrix, distances @ self.risk_matrix
+
+
+class SimulationResult:
+    """Times and risks for every trial and every Goldie location, plus the location actually drawn in each trial."""
+    def __init__(self, strategy, gushers, times, risks, locations):
+        self.strategy = strategy
+        self.gushers = gushers
+        self.times = times  # shape (trials, gushers)
+        self.risks = risks
+        self.locations = locations  # index of the Goldie's gusher in each trial
+
+    def __len__(self):
+        return len(self.locations)
+
+    @property
+    def run_times(self):
+        return self.times[np.arange(len(self)), self.locations]
+
+    @property
+    def run_risks(self):
+        return self.risks[np.arange(len(self)), self.locations]
+
+    def summary(self, percentiles=PERCENTILES, tail=TAIL_FRACTION):
+        """Summarize the time and risk distributions over all trials.
+        'tail' is the average of the worst fraction of trials (expected shortfall)."""
+        return {'time': _describe(self.run_times, percentiles, tail),
+                'risk': _describe(self.run_risks, percentiles, tail)}
+
+    def gusher_summary(self, percentiles=PERCENTILES, tail=TAIL_FRACTION):
+        """Summarize the time and risk distributions separately for each Goldie location."""
+        return {gusher: {'time': _describe(self.times[:, i], percentiles, tail),
+                         'risk': _describe(self.risks[:, i], percentiles, tail)}
+                for i, gusher in enumerate(self.gushers)}
+
+    def report(self, quiet=0):
+        def describe_str(stats):
+            return ', '.join(f'{name}: {value:0.2f}' for name, value in stats.items())
+
+        summary = self.summary()
+        output = f"simulated {len(self)} trials\n" \
+                 f"time: {describe_str(summary['time'])}\n" \
+                 f"risk: {describe_str(summary['risk'])}"
+        if quiet < 2:
+            output += '\n' + '\n'.join(f"{gusher}: time {stats['time']['mean']:0.2f} "
+                                       f"(p{PERCENTILES[-1]} {stats['time'][f'p{PERCENTILES[-1]}']:0.2f}), "
+                                       f"risk {stats['risk']['mean']:0.2f} "
+                                       f"(p{PERCENTILES[-1]} {stats['risk'][f'p{PERCENTILES[-1]}']:0.2f})"
+                                       for gusher, stats in sorted(self.gusher_summary().items()))
+        return output
+
+
+def _describe(samples, percentiles, tail):
+    stats = {'mean': float(samples.mean())}
+    stats.update({f'p{p}': float(value) for p, value in zip(percentiles, np.percentile(samples, percentiles))})
+    n_worst = max(1, int(len(samples)*tail))
+    stats['tail'] = float(np.partition(samples, -n_worst)[-n_worst:].mean())
+    return stats
+
+
+def simulate(strategy, gusher_map, noise=None, trials=100000, seed=None, start=BASKET_LABEL):
+    """Simulate a strategy (GusherNode, strategy string, or CompiledStrat) under noisy travel distances.
+    Each trial samples the distance of every trip in the strategy and draws a Goldie location from the findable
+    gushers, in proportion to their priors.
+    Using the same seed for several strategies makes their results directly comparable."""
+    if not isinstance(strategy, CompiledStrat):
+        strategy = CompiledStrat(strategy, gusher_map, start)
+    if noise is None:
+        noise = lognormal_noise()
+    rng = np.random.default_rng(seed)
+
+    times, risks = strategy.costs(noise(rng, strategy.distances, trials))
+    locations = rng.choice(len(strategy.gushers), size=trials, p=strategy.priors/strategy.priors.sum())
+    return SimulationResult(strategy.strategy, strategy.gushers, times, risks, locations)
+
+
+def simulate_many(strategies, gusher_map, noise=None, trials=100000, seed=0, start=BASKET_LABEL):
+    """Simulate several strategies with the same seed and noise model."""
+    return [simulate(strategy, gusher_map, noise, trials, seed, start) for strategy in strategies]
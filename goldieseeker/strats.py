@@ -1,6 +1,9 @@
 from .GusherMap import GusherMap, BASKET_LABEL
 from .GusherNode import GusherNode, NEVER_FIND_FLAG, write_tree
 from copy import deepcopy
+from collections import namedtuple
+from itertools import islice
+import heapq
 
 
 def flag(findable):
@@ -56,9 +59,10 @@ def get_strat(gushers, start=BASKET_LABEL, tuning=0.5, all_distances=None, all_w
     def score(latency, risk):
         return tuning*risk + (1-tuning)*latency
 
-    def candidate_cost(candidate, latest_open):
-        latency = candidate.total_latency + distance(latest_open, candidate.name)*candidate.size
-        risk = candidate.total_risk + weight(latest_open)*latency
+    def candidate_cost(candidate, latest_open, opened_weight):
+        # The trips in a subtree are scaled by the weights of all gushers opened before them, not just the latest one
+        latency = candidate.total_latency + distance(latest_open, candidate.name)*candidate.mass
+        risk = candidate.total_risk + opened_weight*latency
         return latency, risk
 
     solved_subgraphs = dict()
@@ -117,12 +121,13 @@ def get_strat(gushers, start=BASKET_LABEL, tuning=0.5, all_distances=None, all_w
             solved[key] = deepcopy(candidates)
 
         latest_open = opened[-1]
-        root = min(candidates, key=lambda tree: score(*candidate_cost(tree, latest_open)))
+        opened_weight = sum(weight(vertex) for vertex in opened[1:])  # opened[0] is the start, which has no weight
+        root = min(candidates, key=lambda tree: score(*candidate_cost(tree, latest_open, opened_weight)))
         print_log(f'{key_str}; options: \n' +
                   '\n'.join(f'    ~{latest_open}--{distance(latest_open, tree.name):0.2f}--> ' +
                             f'{tree}({tree.high}, {tree.low}), ' +
                             f'raw score: {score(tree.total_latency, tree.total_risk):0.2f}, ' +
-                            f'final score: {score(*candidate_cost(tree, latest_open)):0.2f}'
+                            f'final score: {score(*candidate_cost(tree, latest_open, opened_weight)):0.2f}'
                             for tree in candidates) +
                   f'\n    choose gusher {root}: {write_tree(root)}')
         return root
@@ -134,6 +139,131 @@ def get_strat(gushers, start=BASKET_LABEL, tuning=0.5, all_distances=None, all_w
     return root
 
 
+def tree_score(tree, gushers, tuning=0.5):
+    """Return the objective score of a strategy tree: a weighted sum of its total time and total risk, where each
+    gusher's time and risk are weighted by its prior."""
+    latencies, risks = tree.get_costs(gushers)
+    total_latency = sum(gushers.prior(gusher)*latency for gusher, latency in latencies.items())
+    total_risk = sum(gushers.prior(gusher)*risk for gusher, risk in risks.items())
+    return tuning*total_risk + (1-tuning)*total_latency
+
+
+# Lightweight stand-in for a GusherNode subtree, used by get_top_strats() to avoid building and copying full trees
+_Candidate = namedtuple('_Candidate', 'name findable high low mass total_latency total_risk')
+
+
+def get_top_strats(gushers, k=5, start=BASKET_LABEL, tuning=0.5):
+    """Build the k best decision trees for a gusher map, using the same objective as get_strat().
+    Returns a list of (score, tree) pairs sorted from best to worst.
+    Each subproblem keeps its k cheapest candidates instead of only the cheapest one. The candidates that open a given
+    gusher first are merged lazily from the k-best lists of its high and low subproblems, so the search costs roughly
+    k times as much as a single solve."""
+    def score(latency, risk):
+        return tuning*risk + (1-tuning)*latency
+
+    def combine(vertex, findable, high, low):
+        mass_h, mass_l = 0, 0
+        totlat_h, totlat_l = 0, 0
+        totrisk_h, totrisk_l = 0, 0
+        if high:
+            mass_h = high.mass
+            totlat_h = high.total_latency + gushers.distance(vertex, high.name)*mass_h
+            totrisk_h = high.total_risk
+        if low:
+            mass_l = low.mass
+            totlat_l = low.total_latency + gushers.distance(vertex, low.name)*mass_l
+            totrisk_l = low.total_risk
+        total_latency = totlat_l + totlat_h
+        total_risk = totrisk_l + totrisk_h + gushers.weight(vertex)*total_latency
+        return _Candidate(vertex, findable, high, low, mass_l + mass_h + (gushers.prior(vertex) if findable else 0),
+                          total_latency, total_risk)
+
+    def candidate_score(candidate, latest_open, opened_weight):
+        # The trips in a subtree are scaled by the weights of all gushers opened before them, as in get_strat()
+        latency = candidate.total_latency + gushers.distance(latest_open, candidate.name)*candidate.mass
+        risk = candidate.total_risk + opened_weight*latency
+        return score(latency, risk)
+
+    def best_pairs(vertex, findable, highs, lows, latest_open, opened_weight):
+        """Yield (score, candidate) for every pairing of high and low subtrees, from best to worst.
+        The score is a sum of separate high and low terms, so once both lists are sorted by their own term, the next
+        best pairing is always a neighbor of one that has already been yielded."""
+        def pair_score(candidate):
+            return candidate_score(candidate, latest_open, opened_weight)
+
+        highs = sorted(highs, key=lambda high: pair_score(combine(vertex, findable, high, None)))
+        lows = sorted(lows, key=lambda low: pair_score(combine(vertex, findable, None, low)))
+
+        def make(i, j):
+            candidate = combine(vertex, findable, highs[i], lows[j])
+            return pair_score(candidate), i, j, candidate
+
+        frontier = [make(0, 0)[:3]]
+        seen = {(0, 0)}
+        while frontier:
+            _, i, j = heapq.heappop(frontier)
+            cand_score, _, _, candidate = make(i, j)
+            yield cand_score, candidate
+            for i_next, j_next in ((i + 1, j), (i, j + 1)):
+                if i_next < len(highs) and j_next < len(lows) and (i_next, j_next) not in seen:
+                    seen.add((i_next, j_next))
+                    heapq.heappush(frontier, make(i_next, j_next)[:3])
+
+    solved = dict()
+    # dict that associates a subproblem with its k best candidates,
+    # sorted by score as seen from the latest opened gusher
+
+    def recurse(suspected, opened):
+        """Return the k best subtrees (as _Candidates) given a set of suspected gushers and a tuple of opened
+        gushers."""
+        n = len(suspected)
+        if n == 0:
+            return [None]
+        if n == 1:
+            vertex = next(iter(suspected))
+            return [_Candidate(vertex, True, None, None, gushers.prior(vertex), 0, 0)]
+
+        latest_open = opened[-1]
+        key = (suspected, frozenset(opened), latest_open)
+        if key not in solved:
+            opened_weight = sum(gushers.weight(vertex) for vertex in opened[1:])  # opened[0] is the start
+            streams = []
+            for vertex in set(gushers).difference(opened):
+                findable = vertex in suspected
+                neighborhood = set(gushers.adj(vertex))
+                suspect_if_high = suspected.intersection(neighborhood)
+                suspect_if_low = suspected.difference({vertex}).difference(neighborhood)
+                if not findable and not (suspect_if_high and suspect_if_low):
+                    continue
+                opened_new = opened + (vertex,)
+                highs = recurse(suspect_if_high, opened_new)
+                lows = recurse(suspect_if_low, opened_new)
+                streams.append(best_pairs(vertex, findable, highs, lows, latest_open, opened_weight))
+            merged = heapq.merge(*streams, key=lambda pair: pair[0])
+            solved[key] = [candidate for _, candidate in islice(merged, k)]
+        return solved[key]
+
+    def build_tree(candidate):
+        if not candidate:
+            return None
+        root = GusherNode(candidate.name, gusher_map=gushers, findable=candidate.findable)
+        high, low = build_tree(candidate.high), build_tree(candidate.low)
+        dist_h, dist_l = 1, 1
+        if high:
+            dist_h = gushers.distance(root.name, high.name)
+        if low:
+            dist_l = gushers.distance(root.name, low.name)
+        root.add_children(high, low, dist_h, dist_l)
+        return root
+
+    strats = []
+    for candidate in recurse(frozenset(gushers), (start,)):
+        root = build_tree(candidate)
+        root.update_costs(gushers, start=start)
+        strats.append((score(root.total_latency, root.total_risk), root))
+    return strats
+
+
 # TODO - move to separate test file
 if __name__ == '__main__':
     import cProfile
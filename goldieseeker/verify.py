@@ -0,0 +1,323 @@
+from collections import namedtuple
+from string import ascii_lowercase
+import numpy as np
+from scipy.spatial.distance import cdist
+from .GusherMap import GusherMap, BASKET_LABEL, DISTANCE_SCALE_FACTOR, map_ids
+from .GusherNode import NEVER_FIND_FLAG, write_tree, _find_errors, _read_strategy
+from .strats import get_strat, tree_score
+
+# Relative tolerance when comparing scores
+TOLERANCE = 1e-9
+
+TUNINGS = (0, 0.5, 1)
+SYNTHETIC_SIZES = (5, 6, 7, 8)
+SYNTHETIC_SEEDS = (0, 1, 2)
+
+# Result of checking one solver on one map; 'errors' lists everything that went wrong (empty if the check passed)
+CheckResult = namedtuple('CheckResult', 'map_id tuning squad reference_score solver_score strategy errors')
+
+
+def synthetic_map(n_gushers, seed=0, squad=False, priors=None):
+    """Build a random map with n_gushers gushers, for testing solvers on maps other than the bundled ones.
+    Gushers are scattered randomly, each one is connected to its nearest neighbors, and weights are chosen from 1-3.
+    Priors default to uniform; pass priors='random' to choose them from 1-4."""
+    rng = np.random.default_rng(seed)
+    names = np.array([BASKET_LABEL] + list(ascii_lowercase[:n_gushers]))
+    coords = rng.integers(0, 1024, size=(n_gushers + 1, 2)).astype('u4')
+    distances = cdist(coords, coords) / DISTANCE_SCALE_FACTOR
+    adjacency = np.zeros(distances.shape, dtype=bool)
+    for i in range(1, n_gushers + 1):
+        # Nearest gushers other than the basket and the gusher itself
+        nearest = [j for j in np.argsort(distances[i]) if j not in (0, i)][:rng.integers(2, 4)]
+        adjacency[i, nearest] = True
+        adjacency[nearest, i] = True
+    weights = {str(name): int(rng.integers(1, 4)) for name in names[1:]}
+    weights['.'] = 1
+    if priors == 'random':
+        priors = {str(name): int(rng.integers(1, 5)) for name in names[1:]}
+        priors['.'] = 1
+        priors = repr(priors)
+    compiled = {'name': f'Synthetic map ({n_gushers} gushers, seed {seed})', 'names': names, 'coords': coords,
+                'distances': distances, 'adjacency': adjacency, 'weights': repr(weights)}
+    return GusherMap.from_compiled(f'synthetic-{n_gushers}-{seed}', compiled, squad=squad, priors=priors)
+
+
+def check_maps(squad_modes=(False, True), synthetic_sizes=SYNTHETIC_SIZES, synthetic_seeds=SYNTHETIC_SEEDS):
+    """Yield the bundled maps and seeded synthetic maps, in each squad mode.
+    Synthetic maps are yielded with both uniform and random priors."""
+    for squad in squad_modes:
+        for map_id in sorted(map_ids()):
+            yield GusherMap(map_id, squad=squad)
+        for n in synthetic_sizes:
+            for seed in synthetic_seeds:
+                yield synthetic_map(n, seed, squad=squad)
+                yield synthetic_map(n, seed, squad=squad, priors='random')
+
+
+def _close(a, b, tol=TOLERANCE):
+    return abs(a - b) <= tol*max(1, abs(a), abs(b))
+
+
+def cross_check(solver, reference=get_strat, gusher_maps=None, tunings=TUNINGS, tol=TOLERANCE):
+    """Run a solver and a reference solver on each map and tuning, and compare the results.
+    Both solvers are called as solver(gusher_map, tuning=tuning) and must return a strategy tree, e.g.
+        cross_check(lambda gusher_map, tuning: get_top_strats(gusher_map, k=1, tuning=tuning)[0][1])
+    The solver's strategy must be valid and its score must match the reference score within tolerance.
+    Maps default to check_maps(). Returns a list of CheckResults."""
+    if gusher_maps is None:
+        gusher_maps = check_maps()
+    results = []
+    for gusher_map in gusher_maps:
+        squad = gusher_map.squad
+        for tuning in tunings:
+            reference_score = tree_score(reference(gusher_map, tuning=tuning), gusher_map, tuning)
+            strat = solver(gusher_map, tuning=tuning)
+            errors = [err.args[1] for err in strat.find_errors(gusher_map)]
+            solver_score = tree_score(strat, gusher_map, tuning)
+            if not _close(solver_score, reference_score, tol):
+                errors.append(f'score {solver_score:g} does not match reference score {reference_score:g}')
+            results.append(CheckResult(gusher_map.map_id, tuning, squad, reference_score, solver_score,
+                                       write_tree(strat), errors))
+    return results
+
+
+def _next_opens(gusher_map, suspected, opened):
+    """Yield (gusher, suspected if high, suspected if low) for every gusher worth opening next, pruned like get_strat.
+    Sets of gushers are bitmasks."""
+    for vertex in gusher_map:
+        bit = gusher_map.bit(vertex)
+        if opened & bit:
+            continue
+        neighborhood = gusher_map.adj_mask(vertex)
+        high, low = suspected & neighborhood, suspected & ~neighborhood & ~bit
+        if suspected & bit or (high and low):
+            yield vertex, high, low
+
+
+class _Subproblems:
+    """Costs of the subproblems of a map, shared by make_certificate() and check_certificate().
+    A subproblem is a set of suspected gushers, a set of opened gushers and the gusher opened most recently. Its value
+    is the least possible contribution to the objective score from the rest of the strategy: every trip serves all of
+    the suspected gushers below it, weighted by their priors, and its risk is scaled by the weights of all gushers
+    opened before it."""
+    def __init__(self, gusher_map, tuning):
+        self.gusher_map = gusher_map
+        self.tuning = tuning
+        self._masses = {}
+        self._opened_weights = {}
+        self._names = {gusher_map.bit(vertex): vertex for vertex in gusher_map}  # bitmask of one gusher -> gusher
+
+    def key(self, suspected, opened, latest):
+        unmask = self.gusher_map.unmask
+        return f"{','.join(unmask(suspected))}|{','.join(unmask(opened))}|{latest}"
+
+    def parse_key(self, key):
+        suspected, opened, latest = key.split('|')
+        if latest != BASKET_LABEL and latest not in self.gusher_map:
+            raise KeyError(latest)
+        mask = self.gusher_map.mask
+        return mask(suspected.split(',') if suspected else []), mask(opened.split(',') if opened else []), latest
+
+    def trip_cost(self, suspected, opened, latest, vertex):
+        if suspected not in self._masses:
+            self._masses[suspected] = sum(map(self.gusher_map.prior, self.gusher_map.unmask(suspected)))
+        if opened not in self._opened_weights:
+            self._opened_weights[opened] = sum(map(self.gusher_map.weight, self.gusher_map.unmask(opened)))
+        scale = (1 - self.tuning) + self.tuning*self._opened_weights[opened]
+        return self._masses[suspected]*self.gusher_map.distance(latest, vertex)*scale
+
+    def base_value(self, suspected, opened, latest):
+        """Return the value of a subproblem with at most one suspected gusher (which must be opened directly)."""
+        if not suspected:
+            return 0
+        return self.trip_cost(suspected, opened, latest, self._names[suspected])
+
+    def choices(self, suspected, opened, latest, value):
+        """Yield (gusher, cost) for every gusher that could be opened next, given a function returning the values of
+        subproblems with more than one suspected gusher."""
+        def child_value(child_suspected, child_opened, vertex):
+            if not child_suspected & (child_suspected - 1):  # at most one suspected gusher
+                return self.base_value(child_suspected, child_opened, vertex)
+            return value(child_suspected, child_opened, vertex)
+
+        for vertex, high, low in _next_opens(self.gusher_map, suspected, opened):
+            child_opened = opened | self.gusher_map.bit(vertex)
+            yield vertex, (self.trip_cost(suspected, opened, latest, vertex) +
+                           child_value(high, child_opened, vertex) + child_value(low, child_opened, vertex))
+
+    def solve(self):
+        """Return the values of every subproblem with more than one suspected gusher, keyed by
+        (suspected, opened, latest) with sets of gushers as bitmasks."""
+        values = {}
+
+        def value(*state):
+            if state not in values:
+                values[state] = min(cost for _, cost in self.choices(*state, value))
+            return values[state]
+
+        value(self.gusher_map.mask(), 0, BASKET_LABEL)
+        return values
+
+    def score(self, root):
+        """Return the objective score of a valid strategy tree (of GusherNodes or _StrategyNodes), as the sum of the
+        costs of its trips."""
+        total = 0
+        stack = [(root, self.gusher_map.mask(), 0, BASKET_LABEL)]
+        while stack:
+            node, suspected, opened, latest = stack.pop()
+            total += self.trip_cost(suspected, opened, latest, node.name)
+            bit = self.gusher_map.bit(node.name)
+            neighborhood = self.gusher_map.adj_mask(node.name)
+            if node.high:
+                stack.append((node.high, suspected & neighborhood, opened | bit, node.name))
+            if node.low:
+                stack.append((node.low, suspected & ~neighborhood & ~bit, opened | bit, node.name))
+        return total
+
+    def strategy(self, values, suspected, opened, latest, vertex):
+        """Return a strategy string for a subproblem that opens a given gusher next and then follows the best choices
+        in a table of values from solve()."""
+        def lookup(*state):
+            return values[state]
+
+        def best(child_suspected, child_opened, child_latest):
+            if not child_suspected:
+                return ''
+            if child_suspected in self._names:
+                return self._names[child_suspected]
+            choices = self.choices(child_suspected, child_opened, child_latest, lookup)
+            child_vertex = min(choices, key=lambda choice: choice[1])[0]
+            return self.strategy(values, child_suspected, child_opened, child_latest, child_vertex)
+
+        bit = self.gusher_map.bit(vertex)
+        neighborhood = self.gusher_map.adj_mask(vertex)
+        high = best(suspected & neighborhood, opened | bit, vertex)
+        low = best(suspected & ~neighborhood & ~bit, opened | bit, vertex)
+        name = vertex if suspected & bit else vertex + NEVER_FIND_FLAG
+        if high and low:
+            return f'{name}({high}, {low})'
+        elif high:
+            return f'{name}({high},)'
+        elif low:
+            return f'{name}(,{low})'
+        return name
+
+
+def make_certificate(gusher_map, tuning=0.5):
+    """Solve a map and certify its optimal score.
+    The certificate records the optimal value of every subproblem, and the best score for each choice of first gusher
+    along with a strategy achieving it. It is a JSON-serializable dict that check_certificate() can check without
+    searching. The table holds every subproblem, not just the roots (424 entries, about 15 KB of JSON, for Lost
+    Outpost)."""
+    subproblems = _Subproblems(gusher_map, tuning)
+    values = subproblems.solve()
+    start = (gusher_map.mask(), 0, BASKET_LABEL)
+    root_scores = dict(subproblems.choices(*start, lambda *state: values[state]))
+    roots = {root: {'score': score, 'strategy': subproblems.strategy(values, *start, root)}
+             for root, score in root_scores.items()}
+    return {'map_id': gusher_map.map_id, 'fingerprint': gusher_map.fingerprint(), 'squad': gusher_map.squad,
+            'tuning': tuning, 'optimum': values[start], 'roots': roots,
+            'subproblems': {subproblems.key(*state): value for state, value in values.items()}}
+
+
+def check_certificate(certificate, gusher_map, strategy=None, tol=TOLERANCE):
+    """Check a certificate from make_certificate() against a map, and optionally check a strategy against it.
+    Each recorded subproblem value must be the best choice of next gusher given the recorded values of the
+    subproblems it leads to. This proves by induction that every value, including the optimum, is optimal. Every
+    entry has to be checked for the proof to hold, so the check is linear in the size of the table and costs about as
+    much as one pass of the dynamic program; it is not a cheap re-check. Each root score must follow from the table in
+    the same way, and the optimum must be the best of them. Every recorded strategy must be valid, open its root first
+    and achieve its root score, and a given strategy (tree or string) must be valid and achieve the optimum.
+    Returns a list of problems found (empty if everything checks out)."""
+    problems = []
+    if certificate['fingerprint'] != gusher_map.fingerprint():
+        return [f"certificate is for a different version of map '{certificate['map_id']}'"]
+    if 'subproblems' not in certificate:
+        return ['certificate has no subproblem values, so it cannot prove optimality']
+    tuning = certificate['tuning']
+    subproblems = _Subproblems(gusher_map, tuning)
+    all_gushers = gusher_map.mask()
+    values = {}
+    for key, recorded in certificate['subproblems'].items():
+        try:
+            values[subproblems.parse_key(key)] = recorded
+        except (KeyError, ValueError):
+            problems.append(f'subproblem {key} is not a valid subproblem of this map')
+
+    def recorded_value(*state):
+        if state not in values:
+            raise KeyError(subproblems.key(*state))
+        return values[state]
+
+    def best_choice(suspected, opened, latest, label):
+        try:
+            return min(cost for _, cost in subproblems.choices(suspected, opened, latest, recorded_value))
+        except KeyError as err:
+            problems.append(f'{label}: subproblem {err.args[0]} is missing')
+
+    for state, recorded in values.items():
+        key = subproblems.key(*state)
+        expected = best_choice(*state, f'subproblem {key}')
+        if expected is not None and not _close(recorded, expected, tol):
+            problems.append(f'subproblem {key}: value {recorded:g} does not match best choice {expected:g}')
+
+    start = (gusher_map.mask(), 0, BASKET_LABEL)
+    expected = best_choice(*start, 'optimum')
+    if expected is not None and not _close(certificate['optimum'], expected, tol):
+        problems.append(f"optimum {certificate['optimum']:g} does not match best choice {expected:g}")
+    try:
+        root_scores = dict(subproblems.choices(*start, recorded_value))
+    except KeyError as err:
+        root_scores = {}
+        problems.append(f'roots: subproblem {err.args[0]} is missing')
+
+    def check(strat, expected_score, label):
+        # Strategies are read and validated as bare trees and scored trip by trip, without building GusherNodes
+        if isinstance(strat, str):
+            try:
+                strat = _read_strategy(strat)
+            except ValueError as err:
+                problems.append(f"{label}: couldn't read strategy: {err}")
+                return None
+        errors = _find_errors(strat, gusher_map, all_gushers)
+        problems.extend(f'{label}: {err.args[1]}' for err in errors)
+        if not errors:
+            score = subproblems.score(strat)
+            if not _close(score, expected_score, tol):
+                problems.append(f'{label}: score {score:g} does not match certified score {expected_score:g}')
+        return strat
+
+    for root, entry in certificate['roots'].items():
+        if root in root_scores and not _close(entry['score'], root_scores[root], tol):
+            problems.append(f"root {root}: score {entry['score']:g} does not match subproblem values "
+                            f"({root_scores[root]:g})")
+        tree = check(entry['strategy'], entry['score'], f'root {root}')
+        if tree and tree.name != root:
+            problems.append(f'root {root}: strategy {entry["strategy"]} opens {tree} first')
+    if not _close(min(entry['score'] for entry in certificate['roots'].values()), certificate['optimum'], tol):
+        problems.append(f"optimum {certificate['optimum']:g} is not the best root score")
+    if strategy is not None:
+        check(strategy, certificate['optimum'], 'strategy')
+    return problems
+
+
+# TODO - move to separate test file
+if __name__ == '__main__':
+    from .strats import get_top_strats
+
+    failures = [result for result in cross_check(lambda G, tuning: get_top_strats(G, k=1, tuning=tuning)[0][1])
+                if result.errors]
+    for result in failures:
+        print(f'{result.map_id} (tuning {result.tuning:g}{", squad" if result.squad else ""}): ' +
+              '; '.join(result.errors))
+    print(f'{len(failures)} failures')
+
+    # Certify each map and check that get_strat() reaches the certified optimum
+    uncertified = 0
+    for G in check_maps():
+        for tuning in TUNINGS:
+            problems = check_certificate(make_certificate(G, tuning), G, get_strat(G, tuning=tuning))
+            if problems:
+                uncertified += 1
+                print(f'{G.map_id} (tuning {tuning:g}{", squad" if G.squad else ""}): ' + '; '.join(problems))
+    print(f'{uncertified} certificate failures')